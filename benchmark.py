@@ -0,0 +1,223 @@
+#  Copyright 2024 Massimiliano Cialdi
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from tracer import create_tracer
+from dataTracer import dataTracer
+from noise_injector_mts import Formatter
+
+# disturb() and dataDump() are copied in every engine, so each copy is measured
+ENGINES = ('noise_injector_mte', 'noise_injector_mts', 'noise_injector_sts')
+CHUNK_SIZES = (16, 256, 1024, 4096)
+ERROR_RATES = (0.0, 0.002, 0.1)
+DUMP_MODES = {'v': (True, False), 'x': (False, True), 'vx': (True, True)}
+TRACE_LEVELS = (0, 3, 4)
+TRACE_MODES = {'sync': (False, False), 'queue': (True, False), 'json': (False, True), 'queue+json': (True, True)}
+
+
+def make_chunk(size, seed=0):
+    """Returns a reproducible chunk of printable and non printable bytes."""
+    rng = random.Random(seed)
+    return bytes(rng.randrange(256) for _ in range(size))
+
+def measure(func, size, min_time, repeat):
+    """Returns the best ns/byte (ns/call if size is None) of func() over some repetitions."""
+    # Find a number of loops lasting at least min_time
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        best = min(best, time.perf_counter_ns() - start)
+    return best / loops / (size or 1)
+
+def unit(size):
+    return 'ns/byte' if size else 'ns/call'
+
+def create_tracers(output):
+    """Returns a tracer for every level and mode, writing to output."""
+    tracers = {}
+    for level in TRACE_LEVELS:
+        for mode, (queued, json_lines) in TRACE_MODES.items():
+            tracers[level, mode] = create_tracer(f"benchmark.{level}.{mode}", level, queued, json_lines, output)
+    return tracers
+
+def cases(tracers):
+    """Yields (name, size, func) for every benchmarked case, size is None for the cases measured per call."""
+    engines = {engine: importlib.import_module(engine) for engine in ENGINES}
+    for size in CHUNK_SIZES:
+        data = make_chunk(size)
+
+        for engine, module in engines.items():
+            for error_rate in ERROR_RATES:
+                rng = random.Random(12345)
+                yield f"{engine} disturb size={size} error_rate={error_rate}", size, lambda f=module.disturb, d=data, e=error_rate, r=rng: f(d, e, 0.2, r)
+
+        for mode, (verbose, hexadecimal) in DUMP_MODES.items():
+            yield f"dataTracer size={size} mode={mode}", size, lambda d=data, v=verbose, x=hexadecimal: dataTracer(d, v, x)
+            for engine, module in engines.items():
+                yield f"{engine} dataDump size={size} mode={mode}", size, lambda f=module.dataDump, d=data, v=verbose, x=hexadecimal: f(d, v, x, '>', len(d), 0)
+
+    # The engines do not trace per chunk, so the Tracer is measured per call,
+    # with a debug trace like the ones of handle_connection
+    for (level, mode), tracer in tracers.items():
+        def trace(t=tracer.with_context(direction='A->B')):
+            t.debug("Random numnber generator seeded with %d", 12345)
+        yield f"Tracer level={level} mode={mode}", None, trace
+
+def run(min_time, repeat, selected):
+    """Returns the results and the unit of each of them."""
+    results = {}
+    units = {}
+    # Anything printed by the benchmarked functions is discarded
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracers = create_tracers(devnull)
+        for name, size, func in cases(tracers):
+            if selected and not any(s in name for s in selected):
+                continue
+            results[name] = measure(func, size, min_time, repeat)
+            units[name] = unit(size)
+            print(f"{name:70} {results[name]:10.2f} {units[name]}", file=sys.stderr)
+        # Waits for the queued traces to be written before closing output
+        for tracer in tracers.values():
+            tracer.stop()
+    return results, units
+
+def compare(results, units, baseline, threshold):
+    """Prints the comparison with the baseline and returns the regressed cases and the ones not in baseline."""
+    regressions = []
+    missing = []
+    for name, value in results.items():
+        if name not in baseline:
+            print(f"{name:70} {value:10.2f} {units[name]} (not in baseline)")
+            missing.append(name)
+            continue
+        change = value / baseline[name] - 1
+        flag = ''
+        if change > threshold:
+            flag = ' REGRESSION'
+            regressions.append(name)
+        print(f"{name:70} {value:10.2f} {units[name]} {change:+8.1%}{flag}")
+    return regressions, missing
+
+def thresholdValidator(string: str) -> float:
+    threshold = float(string)
+
+    if threshold < 0:
+        raise argparse.ArgumentTypeError(f"threshold {threshold} must not be negative")
+    return threshold
+
+def environment():
+    """Describes where the benchmark runs, results are comparable only on the same one."""
+    return {'python': sys.version, 'machine': platform.machine()}
+
+
+description=\
+'''
+Micro-benchmark of the per-chunk hot path of the stream processors:
+disturb(), dataTracer(), dataDump() and Tracer.
+
+Every function is measured (in ns/byte) for several chunk sizes, error rates and dump modes.
+The Tracer is measured (in ns/call) for several levels and trace modes.
+Nothing is sent on the network, and the dumped data is discarded.
+
+The results can be saved as baseline, and later runs can be compared against it:
+the exit status is 1 if some case is slower than the baseline by more than the threshold,
+or if some case is not in the baseline (unless --allow-missing is given).
+Saving with --only updates only the measured cases of the baseline, and a failed comparison
+is not saved (unless --force-save is given), so that the baseline does not lower its own bar.
+'''
+
+epilog=\
+'''
+Usage example:
+
+python3 benchmark.py --save
+(change something)
+python3 benchmark.py --compare
+
+The first line measures all cases and saves them in the baseline file
+The third line measures again all cases, and fails if some of them regressed
+
+python3 benchmark.py --only disturb --compare --threshold 0.05
+
+Only the disturb() cases are measured, and a regression of 5% is enough to fail
+'''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=Formatter, description=description, epilog=epilog)
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="Baseline file")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare the results with the baseline, and fail if some case regressed")
+    parser.add_argument("--threshold", type=thresholdValidator, default=0.2, help="Relative slowdown over which a case is considered regressed (e.g. 0.2 is 20%%)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum time in seconds of each measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of measurements per case, the best one is taken")
+    parser.add_argument("--only", metavar='NAME', action="append", default=[], help="Run only the cases whose name contains NAME (can be repeated)")
+    parser.add_argument("--allow-missing", action="store_true", help="Do not fail the comparison for cases that are not in the baseline")
+    parser.add_argument("--force-save", action="store_true", help="Save the results as baseline even if the comparison failed")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare and not os.path.isfile(args.baseline):
+        parser.error(f"baseline file {args.baseline} not found, create it with --save")
+    if args.compare or (args.save and args.only and os.path.isfile(args.baseline)):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key, value in environment().items():
+            if baseline.get(key) == value:
+                continue
+            if args.save and args.only:
+                parser.error(f"baseline {key} is {baseline.get(key)!r}, but now it is {value!r}: cannot merge the results, save without --only")
+            print(f"warning: baseline {key} is {baseline.get(key)!r}, but now it is {value!r}: results may not be comparable", file=sys.stderr)
+
+    results, units = run(args.min_time, args.repeat, args.only)
+
+    status = 0
+    if args.compare:
+        regressions, missing = compare(results, units, baseline['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} cases regressed more than {args.threshold:.0%}")
+            status = 1
+        if missing:
+            print(f"warning: {len(missing)} cases are not in the baseline", file=sys.stderr)
+            if not args.allow_missing:
+                status = 1
+    if args.save:
+        if status and not args.force_save:
+            print(f"comparison failed, baseline {args.baseline} not saved (use --force-save to save it anyway)", file=sys.stderr)
+        else:
+            if args.only and baseline is not None:
+                # Only the measured cases are updated, the others are kept
+                results = {**baseline['results'], **results}
+            with open(args.baseline, 'w') as f:
+                json.dump({**environment(), 'results': results}, f, indent=2)
+            print(f"baseline saved in {args.baseline}")
+
+    sys.exit(status)
@@ -11,9 +11,9 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-def dataTracer(data, verbose=False, hexadecimal=False):
+def dataFormat(data, verbose=False, hexadecimal=False):
     if not verbose and not hexadecimal:
-        return  # Do not print anything if no option is active
+        return None  # Nothing to format if no option is active
 
     # Determines whether 'date' is a string or byte
     if isinstance(data, str):
@@ -35,12 +35,14 @@ def dataTracer(data, verbose=False, hexadecimal=False):
             else:
                 hex_lines.append(hex_string)
 
-        # Printing of hexadecimal lines
-        print("\n".join(hex_lines))
-    elif verbose:
-        # If only verbose is active, try decoding and print plain text
-        try:
-            text = data.decode('utf-8')
-            print(text)
-        except UnicodeDecodeError:
-            print("Data contains bytes that cannot be decoded in UTF-8")
+        return "\n".join(hex_lines)
+    # If only verbose is active, try decoding and return plain text
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return "Data contains bytes that cannot be decoded in UTF-8"
+
+def dataTracer(data, verbose=False, hexadecimal=False):
+    text = dataFormat(data, verbose, hexadecimal)
+    if text is not None:
+        print(text)
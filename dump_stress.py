@@ -0,0 +1,86 @@
+#  Copyright 2024 Massimiliano Cialdi
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import contextlib
+import importlib
+import io
+import sys
+import threading
+
+ENGINES = ('noise_injector_mte', 'noise_injector_mts', 'noise_injector_sts')
+# Every direction dumps only its own character, so a line of the other one means interleaving
+PAYLOADS = {'>': b'A' * 40, '<': b'B' * 40}
+
+
+def dump_loop(dataDump, dirChar, iterations, barrier):
+    data = PAYLOADS[dirChar]
+    barrier.wait()
+    for i in range(iterations):
+        dataDump(data, True, True, dirChar, len(data), i * len(data))
+
+def check(output):
+    """Returns the number of dumps whose lines got mixed with the other direction."""
+    broken = 0
+    for block in output.split('--\n'):
+        if not block:
+            continue
+        lines = block.splitlines()
+        dirChar = lines[0][:1]
+        if dirChar not in PAYLOADS or len(lines) != 4:
+            broken += 1
+            continue
+        expected = PAYLOADS[dirChar][:1].decode()
+        if any(not line.endswith(expected * 16) and not line.endswith(expected * 8) for line in lines[1:]):
+            broken += 1
+    return broken
+
+def stress(engine, iterations):
+    dataDump = importlib.import_module(engine).dataDump
+    output = io.StringIO()
+    barrier = threading.Barrier(len(PAYLOADS))
+    with contextlib.redirect_stdout(output):
+        threads = [threading.Thread(target=dump_loop, args=(dataDump, dirChar, iterations, barrier)) for dirChar in PAYLOADS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return check(output.getvalue())
+
+
+description=\
+'''
+Stress check of dataDump() of the stream processors.
+Two threads (one per direction) dump at the same time, and the output is checked
+for dumps whose lines got interleaved with the other direction.
+It is meant to be run with a free-threaded python (e.g. python3.13t), where no GIL serializes the threads.
+The exit status is 1 if some dump got interleaved.
+'''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description=description)
+    parser.add_argument("--iterations", type=int, default=20000, help="Number of dumps per direction")
+    parser.add_argument("engines", nargs='*', default=ENGINES, help="Engines to check")
+    args = parser.parse_args()
+
+    # Switch threads as often as possible, to make the interleaving likely also with the GIL
+    sys.setswitchinterval(1e-6)
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    status = 0
+    for engine in args.engines:
+        broken = stress(engine, args.iterations)
+        print(f"{engine:20} {broken} interleaved dumps out of {2 * args.iterations}")
+        if broken:
+            status = 1
+    sys.exit(status)
@@ -17,9 +17,11 @@ import threading
 import random
 import signal
 import sys
+import os
 import textwrap
 from tracer import create_tracer
-from dataTracer import dataTracer
+from trafficTap import create_tap, TAP_MODES
+from dataTracer import dataFormat
 
 
 
@@ -42,15 +44,41 @@ def dataDump(data, verbose, hexadecimal, dirChar, length, startingchar):
     if verbose or hexadecimal:
         import datetime
         current_time = datetime.datetime.now()
-        print(f"{dirChar} {current_time.strftime('%Y-%m-%d %H:%M:%S.%f')} length={length} from={startingchar} to={startingchar+length-1}")
-        dataTracer(data, verbose, hexadecimal)
-        print("--")
+        # The whole dump is written with a single call, so that the two directions
+        # cannot interleave their lines (no GIL is serializing the threads on free-threaded builds)
+        header = f"{dirChar} {current_time.strftime('%Y-%m-%d %H:%M:%S.%f')} length={length} from={startingchar} to={startingchar+length-1}"
+        sys.stdout.write(f"{header}\n{dataFormat(data, verbose, hexadecimal)}\n--\n")
+
+def pin_thread(cpu, tracer):
+    """Pins the calling thread to the given CPU (if any)."""
+    if cpu is None:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        tracer.warning("CPU affinity is not supported on this platform, ignoring cpu %d", cpu)
+        return
+    try:
+        # pid 0 means the calling thread
+        os.sched_setaffinity(0, {cpu})
+        tracer.debug("thread pinned to cpu %d", cpu)
+    except OSError as e:
+        tracer.warning("Unable to pin thread to cpu %d: %s", cpu, e)
+
+def log_gil_status(tracer):
+    """Reports whether the two directions can really run in parallel."""
+    # sys._is_gil_enabled() exists only from python 3.13
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)
+    if is_gil_enabled():
+        tracer.info("GIL enabled, the two directions share one core")
+    else:
+        tracer.info("GIL disabled (free-threaded python), the two directions run in parallel")
 
 
-def handle_connection(src_socket, dst_socket, seed, error_rate, deletion_chance, verbose, hexadecimal, dirChar, stop_event, tracer):
+def handle_connection(src_socket, dst_socket, seed, error_rate, deletion_chance, verbose, hexadecimal, dirChar, cpu, stop_event, tap, tracer):
     outgoingByte = 0
+    tracer = tracer.with_context(direction=threading.current_thread().name, seed=seed)
     tracer.info("thread started")
-    tracer.debug("Random numnber generator seeded with %d" %seed)
+    pin_thread(cpu, tracer)
+    tracer.debug("Random numnber generator seeded with %d", seed)
     rng = random.Random(seed)
     src_socket.settimeout(0.25)  # Set timeout to 250ms for the source socket
     try:
@@ -60,13 +88,15 @@ def handle_connection(src_socket, dst_socket, seed, error_rate, deletion_chance,
                 if not data:
                     break
                 disturbed_data = disturb(data, error_rate, deletion_chance, rng)
+                if tap:
+                    tap.mirror(dirChar, data, disturbed_data)
                 dataDump(disturbed_data, verbose, hexadecimal, dirChar, len(disturbed_data), outgoingByte)
                 outgoingByte += len(disturbed_data)
                 dst_socket.sendall(disturbed_data)
             except socket.timeout:
                 continue  # Continue the loop if timeout occurs, check the stop event
     except Exception as e:
-        tracer.error(f"Error in thread {e}")
+        tracer.error("Error in thread %s", e)
     finally:
         tracer.warning("thread end")
     stop_event.set()
@@ -74,21 +104,24 @@ def handle_connection(src_socket, dst_socket, seed, error_rate, deletion_chance,
 
 def main(args):
 
-    tracer = create_tracer(__name__, args.debug)
+    tracer = create_tracer(__name__, args.debug, args.trace_queue, args.trace_json)
     tracer.info("Starting")
+    log_gil_status(tracer)
     # Prepare connections
     socket_A = socket.create_connection((*args.host_a,))
     socket_B = socket.create_connection((*args.host_b,))
 
-    tracer.info("Socket created A %d and B %d" % (socket_A.fileno(), socket_B.fileno()))
+    tracer.info("Socket created A %d and B %d", socket_A.fileno(), socket_B.fileno())
+
+    tap = create_tap(args.tap, args.tap_mode, args.tap_queue, tracer) if args.tap else None
 
     # Event to signal threads to stop
     stop_event = threading.Event()
     signal.signal(signal.SIGINT, lambda s, f: signal_handler(stop_event, tracer))
 
     # Create and start threads
-    thread_AB = threading.Thread(target=handle_connection, args=(socket_A, socket_B, args.seed_AB, args.error_rate, args.deletion_chance, args.v, args.x, '>', stop_event, tracer), name="A->B")
-    thread_BA = threading.Thread(target=handle_connection, args=(socket_B, socket_A, args.seed_BA, args.error_rate, args.deletion_chance, args.v, args.x, '<', stop_event, tracer), name="B->A")
+    thread_AB = threading.Thread(target=handle_connection, args=(socket_A, socket_B, args.seed_AB, args.error_rate, args.deletion_chance, args.v, args.x, '>', args.cpu_AB, stop_event, tap, tracer), name="A->B")
+    thread_BA = threading.Thread(target=handle_connection, args=(socket_B, socket_A, args.seed_BA, args.error_rate, args.deletion_chance, args.v, args.x, '<', args.cpu_BA, stop_event, tap, tracer), name="B->A")
 
     thread_AB.start()
     thread_BA.start()
@@ -98,10 +131,13 @@ def main(args):
     # Sockets will be closed in thread finally blocks
     tracer.info("All threads have terminated.")
 
-    tracer.info("close socket A %d and B %d"% (socket_A.fileno(), socket_B.fileno()))
+    if tap:
+        tap.close()
+    tracer.info("close socket A %d and B %d", socket_A.fileno(), socket_B.fileno())
     socket_A.close()
     socket_B.close()
 
+    tracer.stop()
 
 
 def hostValidator(string: str) -> tuple[str, int]:
@@ -127,6 +163,24 @@ def probabilityValidator(string: str) -> float:
         raise argparse.ArgumentTypeError(f"probability {prob} is out of the allowed range [0-1]")
     return prob
 
+def cpuValidator(string: str) -> int:
+    cpu = int(string)
+
+    if hasattr(os, "sched_getaffinity"):
+        allowed = os.sched_getaffinity(0)
+        if cpu not in allowed:
+            raise argparse.ArgumentTypeError(f"cpu {cpu} is not among the allowed ones {sorted(allowed)}")
+    elif cpu < 0:
+        raise argparse.ArgumentTypeError(f"cpu {cpu} must not be negative")
+    return cpu
+
+def positiveIntValidator(string: str) -> int:
+    value = int(string)
+
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"value {value} must be greater than 0")
+    return value
+
 description=\
 '''
 Character stream processor. It add 'noise' in the streams between two host.
@@ -151,7 +205,7 @@ noise is randomly generated, and can be controlled with parameters.
 The pseudorandom generators are independent for the two streams.
 
 mte stands for Multi Thread Event
-This is implemented using two thread, and using python events as signaling channel
+This is implemented using two thread (one per direction, optionally pinned to a CPU), and using python events as signaling channel
 '''
 
 epilog=\
@@ -201,6 +255,13 @@ if __name__ == '__main__':
     parser.add_argument("-d", "--debug", action='count', default=1, help="Increase debug level")
     parser.add_argument("-v", action="store_true", help="verbose text dump of data traffic")
     parser.add_argument("-x", action="store_true", help="verbose hexadecimal dump of data traffic")
+    parser.add_argument("--trace-queue", action="store_true", help="Format and write the debug traces in a dedicated thread, so that they do not slow down the data forwarding")
+    parser.add_argument("--trace-json", action="store_true", help="Write the debug traces as JSON lines (with the direction of the stream, where applicable)")
+    parser.add_argument("--tap", metavar='[host:]port', type=hostValidator, default=None, help="Mirror the traffic to observers connecting to this local TCP address. If omitted host is 'localhost'")
+    parser.add_argument("--tap-mode", choices=TAP_MODES, default='post', help="Which data to mirror to the observers: before noise (pre), after noise (post) or both")
+    parser.add_argument("--tap-queue", metavar='N', type=positiveIntValidator, default=256, help="Size (in chunks) of each observer queue. When full, chunks are dropped for that observer only")
+    parser.add_argument("--cpu-AB", metavar='CPU', type=cpuValidator, default=None, help="Pin the thread handling stream A->B to this CPU (Linux only, useful with free-threaded python)")
+    parser.add_argument("--cpu-BA", metavar='CPU', type=cpuValidator, default=None, help="Pin the thread handling stream B->A to this CPU (Linux only, useful with free-threaded python)")
     args = parser.parse_args()
 
     main(args)
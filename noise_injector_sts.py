@@ -18,7 +18,8 @@ import signal
 import sys
 import textwrap
 from tracer import create_tracer
-from dataTracer import dataTracer
+from trafficTap import create_tap, TAP_MODES
+from dataTracer import dataFormat
 import select
 
 
@@ -43,15 +44,16 @@ def dataDump(data, verbose, hexadecimal, dirChar, length, startingchar):
     if verbose or hexadecimal:
         import datetime
         current_time = datetime.datetime.now()
-        print(f"{dirChar} {current_time.strftime('%Y-%m-%d %H:%M:%S.%f')} length={length} from={startingchar} to={startingchar+length-1}")
-        dataTracer(data, verbose, hexadecimal)
-        print("--")
+        # The whole dump is written with a single call, so that the two directions
+        # cannot interleave their lines (no GIL is serializing the threads on free-threaded builds)
+        header = f"{dirChar} {current_time.strftime('%Y-%m-%d %H:%M:%S.%f')} length={length} from={startingchar} to={startingchar+length-1}"
+        sys.stdout.write(f"{header}\n{dataFormat(data, verbose, hexadecimal)}\n--\n")
 
-def handle_connection(socket_A, socket_B, signal_sock, seed_AB, seed_BA, error_rate, deletion_chance, verbose, hexadecimal, tracer):
+def handle_connection(socket_A, socket_B, signal_sock, seed_AB, seed_BA, error_rate, deletion_chance, verbose, hexadecimal, tap, tracer):
     """Handles data transfer and listens for shutdown signals."""
     outgoingByte = 0
-    tracer.debug("A->B Random numnber generator seeded with %d" %seed_AB)
-    tracer.debug("B->A Random numnber generator seeded with %d" %seed_BA)
+    tracer.debug("A->B Random numnber generator seeded with %d", seed_AB)
+    tracer.debug("B->A Random numnber generator seeded with %d", seed_BA)
     rng_AB = random.Random(seed_AB)
     rng_BA = random.Random(seed_BA)
     try:
@@ -68,6 +70,8 @@ def handle_connection(socket_A, socket_B, signal_sock, seed_AB, seed_BA, error_r
                     if not data:
                         raise Exception("No data received, possibly disconnected")
                     disturbed_data = disturb(data, error_rate, deletion_chance, rng_AB)
+                    if tap:
+                        tap.mirror('>', data, disturbed_data)
                     dataDump(disturbed_data, verbose, hexadecimal, '>', len(disturbed_data), outgoingByte)
                     outgoingByte += len(disturbed_data)
                     socket_B.sendall(disturbed_data)
@@ -76,35 +80,42 @@ def handle_connection(socket_A, socket_B, signal_sock, seed_AB, seed_BA, error_r
                     if not data:
                         raise Exception("No data received, possibly disconnected")
                     disturbed_data = disturb(data, error_rate, deletion_chance, rng_BA)
+                    if tap:
+                        tap.mirror('<', data, disturbed_data)
                     dataDump(disturbed_data, verbose, hexadecimal, '<', len(disturbed_data), outgoingByte)
                     outgoingByte += len(disturbed_data)
                     socket_A.sendall(disturbed_data)
 
     except Exception as e:
-        tracer.error(f"Error in thread: {e}")
+        tracer.error("Error in thread: %s", e)
 
 
 def main(args):
 
-    tracer = create_tracer(__name__, args.debug)
+    tracer = create_tracer(__name__, args.debug, args.trace_queue, args.trace_json)
     tracer.info("Starting")
     # Prepare connections
     socket_A = socket.create_connection((*args.host_a,))
     socket_B = socket.create_connection((*args.host_b,))
 
-    tracer.info("Socket created A %d and B %d" % (socket_A.fileno(), socket_B.fileno()))
+    tracer.info("Socket created A %d and B %d", socket_A.fileno(), socket_B.fileno())
+
+    tap = create_tap(args.tap, args.tap_mode, args.tap_queue, tracer) if args.tap else None
 
     signal_sock_src, signal_sock_dst = socket.socketpair()
 
     signal.signal(signal.SIGINT, lambda s, f: signal_handler(signal_sock_src, tracer))
 
-    handle_connection(socket_A, socket_B, signal_sock_dst, args.seed_AB, args.seed_BA, args.error_rate, args.deletion_chance, args.v, args.x, tracer)
+    handle_connection(socket_A, socket_B, signal_sock_dst, args.seed_AB, args.seed_BA, args.error_rate, args.deletion_chance, args.v, args.x, tap, tracer)
 
-    tracer.info("close socket A %d and B %d"% (socket_A.fileno(), socket_B.fileno()))
+    if tap:
+        tap.close()
+    tracer.info("close socket A %d and B %d", socket_A.fileno(), socket_B.fileno())
     socket_A.close()
     socket_B.close()
     signal_sock_src.close()
     signal_sock_dst.close()
+    tracer.stop()
 
 
 
@@ -131,6 +142,13 @@ def probabilityValidator(string: str) -> float:
         raise argparse.ArgumentTypeError(f"probability {prob} is out of the allowed range [0-1]")
     return prob
 
+def positiveIntValidator(string: str) -> int:
+    value = int(string)
+
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"value {value} must be greater than 0")
+    return value
+
 description=\
 '''
 Character stream processor. It add 'noise' in the streams between two host.
@@ -205,6 +223,11 @@ if __name__ == '__main__':
     parser.add_argument("-d", "--debug", action='count', default=1, help="Increase debug level")
     parser.add_argument("-v", action="store_true", help="verbose text dump of data traffic")
     parser.add_argument("-x", action="store_true", help="verbose hexadecimal dump of data traffic")
+    parser.add_argument("--trace-queue", action="store_true", help="Format and write the debug traces in a dedicated thread, so that they do not slow down the data forwarding")
+    parser.add_argument("--trace-json", action="store_true", help="Write the debug traces as JSON lines (with the direction of the stream, where applicable)")
+    parser.add_argument("--tap", metavar='[host:]port', type=hostValidator, default=None, help="Mirror the traffic to observers connecting to this local TCP address. If omitted host is 'localhost'")
+    parser.add_argument("--tap-mode", choices=TAP_MODES, default='post', help="Which data to mirror to the observers: before noise (pre), after noise (post) or both")
+    parser.add_argument("--tap-queue", metavar='N', type=positiveIntValidator, default=256, help="Size (in chunks) of each observer queue. When full, chunks are dropped for that observer only")
     args = parser.parse_args()
 
     main(args)
@@ -11,16 +11,58 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import threading
+
+# Overwrites the layer name with the appropriate character (once, for all the tracers)
+logging.addLevelName(logging.DEBUG, 'D')
+logging.addLevelName(logging.INFO, 'I')
+logging.addLevelName(logging.WARNING, 'W')
+logging.addLevelName(logging.ERROR, 'E')
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a compact JSON line, including the context fields (if any)."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'prog': os.path.basename(sys.argv[0]),
+            'pid': record.process,
+            'thread': record.threadName,
+            'level': record.levelname,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(',', ':'))
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for a listener in the same process.
+
+    The record is enqueued as it is: merging the message and its arguments is left
+    to the listener thread, so that the calling thread only pays for the put().
+    """
+
+    def prepare(self, record):
+        return record
 
 
 class Tracer(logging.Logger):
     __LOG_LEVELS = {1: logging.ERROR, 2: logging.WARNING, 3: logging.INFO, 4: logging.DEBUG}
 
-    def __init__(self, name, level):
+    def __init__(self, name, level, queued=False, json_lines=False, stream=None):
         super().__init__(name, level)
+        # Arguments the tracer was created with, checked by create_tracer
+        self.options = (level, queued, json_lines)
 
         # Management of level 0 to completely disable logs
         if level <= 0:
@@ -33,19 +75,64 @@ class Tracer(logging.Logger):
         # if you want to customize datetime format (instead of having ISO 8601) you need to use 'datefmt' parameter
         # for example
         #       datefmt='%Y/%m/%d %H:%M:%S'
-        formatter = logging.Formatter(
-            fmt='%(asctime)s ' + os.path.basename(sys.argv[0]) + '[%(process)d] %(threadName)s %(levelname)s %(message)s'
-        )
-        handler = logging.StreamHandler(sys.stdout)
+        if json_lines:
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                fmt='%(asctime)s ' + os.path.basename(sys.argv[0]) + '[%(process)d] %(threadName)s %(levelname)s %(message)s'
+            )
+        handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
         handler.setFormatter(formatter)
-        self.addHandler(handler)
+
+        self.listener = None
+        if queued:
+            # The records are formatted and written by the listener thread,
+            # the calling (forwarding) thread only puts them in the queue
+            records = queue.SimpleQueue()
+            self.queue_handler = LocalQueueHandler(records)
+            self.addHandler(self.queue_handler)
+            self.listener = logging.handlers.QueueListener(records, handler)
+            self.listener.start()
+            atexit.register(self.stop)
+        else:
+            self.addHandler(handler)
         self.setLevel(self.log_level)
-        # Overwrites the layer name with the appropriate character
-        logging.addLevelName(logging.DEBUG, 'D')
-        logging.addLevelName(logging.INFO, 'I')
-        logging.addLevelName(logging.WARNING, 'W')
-        logging.addLevelName(logging.ERROR, 'E')
+
+    def with_context(self, **context):
+        """Returns a tracer that adds the given fields to every record (shown in JSON lines output)."""
+        return logging.LoggerAdapter(self, {'context': context})
+
+    def stop(self):
+        """Writes all the queued records and stops the listener thread (if any).
+
+        The records traced afterwards are written synchronously, and the name is released,
+        so that create_tracer will create a new Tracer for it.
+        """
+        listener, self.listener = self.listener, None
+        if listener:
+            # Swap the handlers before draining the queue, so that no record can be put
+            # in the queue once the listener is gone
+            self.addHandler(listener.handlers[0])
+            self.removeHandler(self.queue_handler)
+            listener.stop()
+            with _tracers_lock:
+                if _tracers.get(self.name) is self:
+                    del _tracers[self.name]
+
+
+_tracers = {}
+_tracers_lock = threading.Lock()
 
 # Factory function to create a Tracer with the correct name
-def create_tracer(name, level):
-    return Tracer(name, level)
+# Calling it again with the same name returns the same Tracer, without adding handlers.
+# In that case level, queued and json_lines must be the same of the first call (ValueError otherwise),
+# while stream is ignored
+def create_tracer(name, level, queued=False, json_lines=False, stream=None):
+    with _tracers_lock:
+        tracer = _tracers.get(name)
+        if tracer is None:
+            tracer = Tracer(name, level, queued, json_lines, stream)
+            _tracers[name] = tracer
+        elif tracer.options != (level, queued, json_lines):
+            raise ValueError(f"tracer {name} already created with level, queued, json_lines = {tracer.options}")
+        return tracer
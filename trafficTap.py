@@ -0,0 +1,169 @@
+#  Copyright 2024 Massimiliano Cialdi
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import queue
+import socket
+import struct
+import threading
+import time
+
+# Every mirrored chunk is sent to the observers as a frame:
+#   direction (1 byte, '>' for A->B or '<' for B->A)
+#   stage     (1 byte, 'r' raw data before noise, 'd' disturbed data after noise)
+#   length    (4 bytes, big endian)
+#   data      (length bytes)
+FRAME_HEADER = struct.Struct('!ccI')
+STAGE_RAW = b'r'
+STAGE_DISTURBED = b'd'
+
+TAP_MODES = ('pre', 'post', 'both')
+# Seconds given to the observers to receive the frames still queued when the tap is closed
+CLOSE_TIMEOUT = 2.0
+
+
+class Observer:
+    """One observer connection, with its own bounded queue and sender thread."""
+
+    def __init__(self, sock, address, queue_size, tracer):
+        self.sock = sock
+        self.address = address
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.lock = threading.Lock()  # Both the forwarding threads can drop frames
+        self.tracer = tracer
+        self.thread = threading.Thread(target=self._sender, name="tap %s:%d" % address[:2], daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def push(self, frame):
+        """Enqueues a frame without ever blocking. Returns False if the observer is gone."""
+        if not self.thread.is_alive():
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            # The observer is too slow, the frame is lost for it only
+            with self.lock:
+                self.dropped += 1
+        return True
+
+    def finish(self, deadline):
+        """Asks the sender to exit once the queued frames have been sent."""
+        try:
+            self.queue.put(None, timeout=max(0, deadline - time.monotonic()))
+        except queue.Full:
+            pass  # The observer is stuck, join() will shut down the socket
+
+    def join(self, deadline):
+        """Waits for the sender until deadline, then shuts down the socket of a stuck observer."""
+        self.thread.join(max(0, deadline - time.monotonic()))
+        if self.thread.is_alive():
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.thread.join()
+
+    def _sender(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                self.sock.sendall(frame)
+        except OSError as e:
+            self.tracer.debug("observer %s:%d error: %s", *self.address[:2], e)
+        finally:
+            self.sock.close()
+            self.tracer.info("observer %s:%d disconnected, %d frames dropped", *self.address[:2], self.dropped)
+
+
+class TrafficTap:
+    """Mirrors the streams to any number of observers connected to a local TCP port.
+
+    The forwarding threads only enqueue frames (mirror() never blocks), so a slow
+    or stuck observer can never delay the data path.
+    """
+
+    def __init__(self, address, mode, queue_size, tracer):
+        self.mode = mode
+        self.queue_size = queue_size
+        self.tracer = tracer
+        self.mirror_raw = mode in ('pre', 'both')
+        self.mirror_disturbed = mode in ('post', 'both')
+        self.closed = threading.Event()
+        self.lock = threading.Lock()  # Serializes changes to the observers tuple
+        self.observers = ()  # Replaced as a whole, so that readers need no lock
+        self.server = socket.create_server(address)
+        self.server.settimeout(0.25)  # Set timeout to 250ms to check the closed event
+        self.thread = threading.Thread(target=self._acceptor, name="tap", daemon=True)
+
+    def start(self):
+        self.tracer.info("tap listening on %s:%d, mode %s", *self.server.getsockname()[:2], self.mode)
+        self.thread.start()
+
+    def mirror(self, dirChar, data, disturbed_data):
+        observers = self.observers
+        if not observers:
+            return
+        gone = []
+        for stage, chunk, enabled in ((STAGE_RAW, data, self.mirror_raw), (STAGE_DISTURBED, disturbed_data, self.mirror_disturbed)):
+            if not enabled:
+                continue
+            frame = FRAME_HEADER.pack(dirChar.encode(), stage, len(chunk)) + chunk
+            for observer in observers:
+                if not observer.push(frame):
+                    gone.append(observer)
+        if gone:
+            self._remove(gone)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Stops accepting observers, and lets the connected ones receive the frames still queued."""
+        self.closed.set()
+        self.thread.join()
+        self.server.close()
+        with self.lock:
+            observers, self.observers = self.observers, ()
+        deadline = time.monotonic() + timeout
+        for observer in observers:
+            observer.finish(deadline)
+        for observer in observers:
+            observer.join(deadline)
+
+    def _remove(self, gone):
+        with self.lock:
+            self.observers = tuple(o for o in self.observers if o not in gone)
+
+    def _acceptor(self):
+        while not self.closed.is_set():
+            try:
+                sock, address = self.server.accept()
+            except socket.timeout:
+                continue  # Continue the loop if timeout occurs, check the closed event
+            except OSError as e:
+                self.tracer.error("tap error: %s", e)
+                break
+            sock.settimeout(None)
+            observer = Observer(sock, address, self.queue_size, self.tracer)
+            observer.start()
+            with self.lock:
+                self.observers = self.observers + (observer,)
+            self.tracer.info("observer %s:%d connected", *address[:2])
+
+
+# Factory function to create and start a TrafficTap
+def create_tap(address, mode, queue_size, tracer):
+    tap = TrafficTap(address, mode, queue_size, tracer)
+    tap.start()
+    return tap